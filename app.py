@@ -2,20 +2,19 @@ import streamlit as st
 import re
 from db_mongodb import (
     save_entry,
-    get_entry,
     delete_entry,
     log_tries,
-    get_all_statistics,
+    get_all_statistics_cached,
 )
 
 # =============================================================================
-# Mock Database Layer
+# Input Sanitization / Validation
 # =============================================================================
-# In production, this would be replaced with actual MongoDB operations.
-# Note: For MongoDB, additional NoSQL injection sanitization would be required.
 
-if "db" not in st.session_state:
-    st.session_state.db = {}
+# Precompiled patterns; sanitize_input/validate_email run on every submit
+_CTRL_RE = re.compile(r"[\x00-\x1f\x7f-\x9f]")
+_EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\Z")
+_ESCAPE_TBL = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
 
 
 def sanitize_input(value: str) -> str:
@@ -25,47 +24,23 @@ def sanitize_input(value: str) -> str:
     In production with MongoDB, additional sanitization for $ and . operators
     would be needed to prevent NoSQL injection.
     """
-    if not isinstance(value, str):
-        return ""
     value = value.strip()
-    value = re.sub(r"[\x00-\x1f\x7f-\x9f]", "", value)
-    value = value.replace("<", "&lt;").replace(">", "&gt;")
+    value = _CTRL_RE.sub("", value)
+    value = value.translate(_ESCAPE_TBL)
     return value
 
 
 def validate_email(email: str) -> bool:
     """
     Validate email format: must contain @ and a domain with at least one dot.
+    Cheap length and structure checks reject obvious failures before the regex.
     """
-    pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    return bool(re.match(pattern, email))
-
-
-# def save_entry(email: str, show: str) -> None:
-#     """
-#     Save or overwrite an entry in the mock database.
-#     Email serves as the unique key; submitting again overwrites the show.
-#     """
-#     st.session_state.db[email.lower()] = show
-
-
-# def get_entry(email: str) -> str | None:
-#     """
-#     Retrieve the show for a given email, or None if not found.
-#     """
-#     return st.session_state.db.get(email.lower())
-
-
-# def delete_entry(email: str) -> bool:
-#     """
-#     Delete an entry from the mock database.
-#     Returns True if entry existed and was deleted, False otherwise.
-#     """
-#     email_key = email.lower()
-#     if email_key in st.session_state.db:
-#         del st.session_state.db[email_key]
-#         return True
-#     return False
+    if not 5 <= len(email) <= 254:
+        return False
+    at = email.rfind("@")
+    if at < 1 or "." not in email[at + 1 :]:
+        return False
+    return _EMAIL_RE.match(email) is not None
 
 
 # =============================================================================
@@ -97,6 +72,8 @@ TELE_SHOWS = [
     "Oh, Mary!",
 ]
 
+ALL_SHOWS = tuple(SHOWS + TELE_SHOWS)
+
 # =============================================================================
 # Streamlit App
 # =============================================================================
@@ -119,7 +96,7 @@ with tab1:
 
     stats_show = st.selectbox(
         "Select a show:",
-        options=SHOWS + TELE_SHOWS,
+        options=ALL_SHOWS,
         index=0,
         key="stats_show",  # same auto id
     )
@@ -152,21 +129,22 @@ with tab1:
     st.divider()
     st.subheader("Average Tries Per Show")
 
-    statistics = get_all_statistics()
+    statistics = get_all_statistics_cached()
 
     if statistics:
-        for show in SHOWS + TELE_SHOWS:
-            if show in statistics:
-                avg_tries = statistics[show]["avgTries"]
-                count = statistics[show]["count"]
-                st.metric(
-                    label=show,
-                    value=f"{avg_tries} tries",
-                    delta=f"{count} reports",
-                    delta_color="off",
-                )
-            else:
-                st.metric(label=show, value="No data yet")
+        stat_cols = st.columns(4)
+        for i, show in enumerate(ALL_SHOWS):
+            show_stats = statistics.get(show)
+            with stat_cols[i % 4]:
+                if show_stats:
+                    st.metric(
+                        label=show,
+                        value=f"{show_stats['avgTries']} tries",
+                        delta=f"{show_stats['count']} reports",
+                        delta_color="off",
+                    )
+                else:
+                    st.metric(label=show, value="No data yet")
     else:
         st.info("No statistics available yet. Start logging your attempts!")
 
@@ -216,20 +194,18 @@ with tab2:
         elif not validate_email(sanitized_email):
             st.error("Please enter a valid email address (e.g., you@example.com).")
         else:
-            existing_entry = get_entry(sanitized_email)
-            save_entry(sanitized_email, selected_show, selected_quantity)
+            saved, existing_entry = save_entry(
+                sanitized_email, selected_show, selected_quantity
+            )
 
-            if existing_entry:
-                st.success(
-                    f"You're signed up for {selected_show} with email: {sanitized_email} ({selected_quantity} ticket(s))"
-                )
-                st.info(
-                    f"Your previous entry for {existing_entry['show']} has been updated."
-                )
-            else:
+            if saved:
                 st.success(
                     f"You're signed up for {selected_show} with email: {sanitized_email} ({selected_quantity} ticket(s))"
                 )
+                if existing_entry is not None:
+                    st.info(
+                        f"Your previous entry for {existing_entry['show']} has been updated."
+                    )
 
     if cancel_clicked:
         sanitized_email = sanitize_input(email_input)
@@ -239,9 +215,8 @@ with tab2:
         elif not validate_email(sanitized_email):
             st.error("Please enter a valid email address (e.g., you@example.com).")
         else:
-            existing_entry = get_entry(sanitized_email)
-            if existing_entry:
-                delete_entry(sanitized_email)
+            existing_entry = delete_entry(sanitized_email)
+            if existing_entry is not None:
                 st.success(
                     f"Your entry for {existing_entry['show']} ({existing_entry['quantity']} ticket(s)) has been cancelled."
                 )
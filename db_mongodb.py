@@ -4,12 +4,42 @@ Provides a MongoDB-backed replacement for the mock database layer.
 Uses Streamlit secrets for secure MongoDB URI configuration.
 """
 
+import logging
+import queue
+import random
+import threading
+import time
 import streamlit as st
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
 from pymongo.errors import ServerSelectionTimeoutError, PyMongoError
-from typing import Optional
+from typing import NamedTuple, Optional
 from datetime import datetime, timezone
 
+logger = logging.getLogger(__name__)
+
+DATABASE_NAME = "broadway_lottery"
+
+# Action logs are written off the request path by a background thread
+_LOG_BATCH_SIZE = 50
+_LOG_FLUSH_INTERVAL = 0.1  # seconds
+
+# Action logs older than this are removed by the TTL index on logs.timestamp
+LOG_RETENTION_DAYS = 30
+
+
+class SaveResult(NamedTuple):
+    """
+    Result of save_entry.
+    Unpacks as (saved, previous) and is falsy when the save failed, so
+    'if save_entry(...)' keeps working as with the old bool return.
+    """
+
+    saved: bool
+    previous: Optional[dict]  # replaced entry ('show', 'quantity'), if any
+
+    def __bool__(self) -> bool:
+        return self.saved
+
 
 @st.cache_resource
 def get_mongo_client():
@@ -33,9 +63,23 @@ def get_mongo_client():
                 "Please add it to .streamlit/secrets.toml"
             )
 
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        # Wire compression: zstd when available, zlib (stdlib) as fallback.
+        # Keep a couple of warm connections so the first click after an idle
+        # period does not pay for a new TCP/TLS handshake.
+        client = MongoClient(
+            mongo_uri,
+            serverSelectionTimeoutMS=5000,
+            compressors="zstd,zlib",
+            zlibCompressionLevel=3,
+            minPoolSize=2,
+            maxPoolSize=20,
+            maxIdleTimeMS=60000,
+            retryWrites=True,
+            w="majority",
+        )
         # Verify connection
         client.admin.command("ping")
+        _ensure_indexes(client)
         return client
     except ValueError as e:
         st.error(f"Configuration Error: {str(e)}")
@@ -48,6 +92,67 @@ def get_mongo_client():
         raise
 
 
+def _log_sample_rate() -> float:
+    """
+    Fraction of submitted/updated actions that are logged, read from the
+    LOG_SAMPLE_RATE Streamlit secret (default 1.0). Bad values are logged,
+    not shown to users: a non-number falls back to 1.0, and out-of-range
+    values are clamped to [0, 1].
+    """
+    raw_rate = st.secrets.get("LOG_SAMPLE_RATE", 1.0)
+    try:
+        rate = float(raw_rate)
+    except (TypeError, ValueError):
+        logger.warning(
+            "LOG_SAMPLE_RATE must be a number, got %r; logging every action",
+            raw_rate,
+        )
+        return 1.0
+
+    if not 0.0 <= rate <= 1.0:
+        logger.warning(
+            "LOG_SAMPLE_RATE must be between 0 and 1, got %r; clamping", rate
+        )
+        rate = 0.0 if rate < 0.0 else 1.0
+    return rate
+
+
+def _ensure_indexes(client: MongoClient) -> None:
+    """
+    Create the indexes used by the lookups and sorts in this module.
+    create_index is idempotent, and get_mongo_client is cached, so this runs
+    once per process. Each index is created independently, non-unique ones
+    first, so a unique index rejected by legacy duplicates does not stop the
+    others (including the log TTL index) from being created.
+
+    Args:
+        client: Connected MongoDB client
+    """
+    db = client[DATABASE_NAME]
+    indexes = [
+        ("logs", [("email", ASCENDING), ("timestamp", DESCENDING)], {}),
+        ("logs", [("action", ASCENDING), ("timestamp", DESCENDING)], {}),
+        # TTL index: MongoDB prunes logs older than LOG_RETENTION_DAYS. It also
+        # serves the newest-first sort in get_all_logs (walked in reverse).
+        (
+            "logs",
+            [("timestamp", ASCENDING)],
+            {"expireAfterSeconds": LOG_RETENTION_DAYS * 24 * 60 * 60},
+        ),
+        ("entries", [("email", ASCENDING)], {"unique": True}),
+        ("tries", [("email", ASCENDING), ("show", ASCENDING)], {"unique": True}),
+    ]
+    for collection_name, keys, options in indexes:
+        try:
+            db[collection_name].create_index(keys, **options)
+        except PyMongoError as e:
+            # Missing indexes only cost performance; keep the app usable.
+            # Not st.error: cache_resource would replay it on every call.
+            logger.warning(
+                "Failed to create index %s on %s: %s", keys, collection_name, e
+            )
+
+
 def get_database():
     """
     Get the Broadway lottery database.
@@ -56,7 +161,7 @@ def get_database():
         Database: MongoDB database object
     """
     client = get_mongo_client()
-    return client["broadway_lottery"]
+    return client[DATABASE_NAME]
 
 
 def get_entries_collection():
@@ -96,6 +201,69 @@ def get_logs_collection():
     return collection
 
 
+def _write_log(log_entry: dict) -> None:
+    """
+    Queue an action log entry for the background log writer.
+    Returns immediately, so the entry write is the only round-trip the user waits on.
+
+    Args:
+        log_entry: Log document (email, show, quantity, action, timestamp)
+    """
+    _log_writer().put(log_entry)
+
+
+@st.cache_resource(show_spinner=False)
+def _log_writer() -> "queue.Queue[dict]":
+    """
+    Create the log queue and start the background thread that drains it.
+    Both live in one cached resource so a module reload cannot leave a new
+    queue without a reader.
+
+    Returns:
+        queue.Queue: Queue of pending log documents
+    """
+    log_queue: "queue.Queue[dict]" = queue.Queue()
+    threading.Thread(
+        target=_drain_log_queue,
+        args=(get_mongo_client(), log_queue),
+        name="log-writer",
+        daemon=True,
+    ).start()
+    return log_queue
+
+
+def _drain_log_queue(client: MongoClient, log_queue: "queue.Queue[dict]") -> None:
+    """
+    Background loop that inserts queued log entries in batches.
+    A batch is flushed once it holds _LOG_BATCH_SIZE entries or
+    _LOG_FLUSH_INTERVAL seconds after its first entry arrived.
+    Entries still queued when the process exits are lost.
+
+    Args:
+        client: Connected MongoDB client
+        log_queue: Queue of pending log documents
+    """
+    logs_collection = client[DATABASE_NAME]["logs"]
+    while True:
+        batch = [log_queue.get()]
+        deadline = time.monotonic() + _LOG_FLUSH_INTERVAL
+        while len(batch) < _LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(log_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            logs_collection.insert_many(batch, ordered=False)
+        except Exception:
+            # Keep the writer alive whatever the failure. No Streamlit script
+            # context in this thread, so st.error is unavailable.
+            logger.exception("Failed to write %d log entries", len(batch))
+
+
 def log_tries(email: str, show: str, tries: int) -> None:
     """
     Log the number of tries for an email and show combination.
@@ -127,53 +295,88 @@ def log_tries(email: str, show: str, tries: int) -> None:
             },
             upsert=True,
         )
+        # New tries change the per-show averages
+        _get_all_statistics_cached.clear()
     except PyMongoError as e:
         st.error(f"Failed to save entry: {str(e)}")
 
 
+def _aggregate_all_statistics() -> dict:
+    """
+    Run the per-show tries aggregation.
+    Lets PyMongoError propagate so the cached caller does not store failures.
+    """
+    collection = get_tries_collection()
+    pipeline = [
+        {
+            "$group": {
+                "_id": "$show",
+                "avgTries": {"$avg": "$tries"},
+                "count": {"$sum": 1},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "show": "$_id",
+                # pick how you want to display:
+                # round to integer for UI "X tries"
+                "avgTries": {"$round": ["$avgTries", 0]},
+                "count": 1,
+            }
+        },
+    ]
+
+    rows = list(collection.aggregate(pipeline))
+    # return dict like {
+    # "Friends": {"avgTries": 4, "count": 2},
+    # "Lost": {"avgTries": 2, "count": 1}
+    # }
+    return {
+        r["show"]: {"avgTries": int(r["avgTries"]), "count": r["count"]}
+        for r in rows
+    }
+
+
 def get_all_statistics():
     try:
-        collection = get_tries_collection()
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$show",
-                    "avgTries": {"$avg": "$tries"},
-                    "count": {"$sum": 1},
-                }
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "show": "$_id",
-                    # pick how you want to display:
-                    # round to integer for UI "X tries"
-                    "avgTries": {"$round": ["$avgTries", 0]},
-                    "count": 1,
-                }
-            },
-        ]
+        return _aggregate_all_statistics()
+    except PyMongoError as e:
+        st.error(f"Failed to get stats: {str(e)}")
+        return {}
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _get_all_statistics_cached() -> dict:
+    """
+    Cached per-show tries aggregation; cleared by log_tries.
+    Errors are raised rather than returned, so they are never cached.
+    """
+    return _aggregate_all_statistics()
 
-        rows = list(collection.aggregate(pipeline))
-        # return dict like {
-        # "Friends": {"avgTries": 4, "count": 2},
-        # "Lost": {"avgTries": 2, "count": 1}
-        # }
-        return {
-            r["show"]: {"avgTries": int(r["avgTries"]), "count": r["count"]}
-            for r in rows
-        }
+
+def get_all_statistics_cached() -> dict:
+    """
+    Cached variant of get_all_statistics.
+    Avoids re-running the aggregation on every Streamlit rerun; the cache
+    is cleared by log_tries whenever new tries are written.
+
+    Returns:
+        dict: Same shape as get_all_statistics
+    """
+    try:
+        return _get_all_statistics_cached()
     except PyMongoError as e:
         st.error(f"Failed to get stats: {str(e)}")
         return {}
 
 
-def save_entry(email: str, show: str, quantity: int = 2) -> bool:
+def save_entry(email: str, show: str, quantity: int = 2) -> SaveResult:
     """
     Save or overwrite an entry in MongoDB.
     Email serves as the unique key; submitting again overwrites the show and quantity.
     Includes NoSQL injection prevention through parameterized queries.
-    Also logs the action with timestamp.
+    Also logs the action with timestamp, sampled at the LOG_SAMPLE_RATE secret.
 
     Args:
         email: User's email address (will be lowercased and used as unique key)
@@ -181,22 +384,18 @@ def save_entry(email: str, show: str, quantity: int = 2) -> bool:
         quantity: Number of tickets (1 or 2, defaults to 2)
 
     Returns:
-        bool: True if entry was saved successfully
+        SaveResult: Whether the entry was saved, and the previous entry
+            ('show' and 'quantity' keys) if one was replaced. Falsy on failure.
 
     Raises:
         PyMongoError: If database operation fails
     """
     try:
         collection = get_entries_collection()
-        logs_collection = get_logs_collection()
         current_time = datetime.now(timezone.utc)
 
-        # Check if this is an update or new entry
-        existing_entry = collection.find_one({"email": email.lower()})
-        action = "updated" if existing_entry else "submitted"
-
-        # Use replace_one with upsert to handle both insert and update
-        result = collection.replace_one(
+        # Upsert and fetch the previous document in a single round-trip
+        previous = collection.find_one_and_replace(
             {"email": email.lower()},
             {
                 "email": email.lower(),
@@ -204,12 +403,16 @@ def save_entry(email: str, show: str, quantity: int = 2) -> bool:
                 "quantity": quantity,
                 "timestamp": current_time,
             },
+            projection={"_id": 0, "show": 1, "quantity": 1},
             upsert=True,
+            return_document=ReturnDocument.BEFORE,
         )
+        # Projection drops _id, so an entry without show/quantity comes back as {}
+        action = "updated" if previous is not None else "submitted"
 
-        # Log the action
-        if result.matched_count > 0 or result.upserted_id is not None:
-            logs_collection.insert_one(
+        # Log the action (sampled, see _log_sample_rate)
+        if random.random() < _log_sample_rate():
+            _write_log(
                 {
                     "email": email.lower(),
                     "show": show,
@@ -218,12 +421,19 @@ def save_entry(email: str, show: str, quantity: int = 2) -> bool:
                     "timestamp": current_time,
                 }
             )
-            return True
 
-        return False
+        if previous is not None:
+            return SaveResult(
+                True,
+                {
+                    "show": previous.get("show"),
+                    "quantity": previous.get("quantity", 2),
+                },
+            )
+        return SaveResult(True, None)
     except PyMongoError as e:
         st.error(f"Failed to save entry: {str(e)}")
-        return False
+        return SaveResult(False, None)
 
 
 def get_entry(email: str) -> Optional[dict]:
@@ -241,9 +451,12 @@ def get_entry(email: str) -> Optional[dict]:
     """
     try:
         collection = get_entries_collection()
-        entry = collection.find_one({"email": email.lower()})
+        entry = collection.find_one(
+            {"email": email.lower()}, {"_id": 0, "show": 1, "quantity": 1}
+        )
 
-        if entry:
+        # Projection drops _id, so an entry without show/quantity comes back as {}
+        if entry is not None:
             return {"show": entry.get("show"), "quantity": entry.get("quantity", 2)}
         return None
     except PyMongoError as e:
@@ -251,7 +464,7 @@ def get_entry(email: str) -> Optional[dict]:
         return None
 
 
-def delete_entry(email: str) -> bool:
+def delete_entry(email: str) -> Optional[dict]:
     """
     Delete an entry from MongoDB.
     Also logs the cancellation action with timestamp.
@@ -260,38 +473,44 @@ def delete_entry(email: str) -> bool:
         email: User's email address to delete
 
     Returns:
-        bool: True if entry existed and was deleted, False if not found
+        Optional[dict]: The deleted entry ('show' and 'quantity' keys) if one
+            existed, None if not found or the delete failed
 
     Raises:
         PyMongoError: If database operation fails
     """
     try:
         collection = get_entries_collection()
-        logs_collection = get_logs_collection()
+        current_time = datetime.now(timezone.utc)
 
-        # Get the entry before deleting to know what show was deleted
-        entry = collection.find_one({"email": email.lower()})
-
-        if entry:
-            result = collection.delete_one({"email": email.lower()})
-
-            if result.deleted_count > 0:
-                # Log the cancellation
-                logs_collection.insert_one(
-                    {
-                        "email": email.lower(),
-                        "show": entry.get("show"),
-                        "quantity": entry.get("quantity", 2),
-                        "action": "cancelled",
-                        "timestamp": datetime.now(timezone.utc),
-                    }
-                )
-                return True
+        # Delete and fetch the entry in one round-trip to know what show was deleted
+        entry = collection.find_one_and_delete(
+            {"email": email.lower()},
+            projection={"_id": 0, "show": 1, "quantity": 1},
+        )
 
-        return False
+        # Projection drops _id, so an entry without show/quantity comes back as {}
+        if entry is not None:
+            deleted = {
+                "show": entry.get("show"),
+                "quantity": entry.get("quantity", 2),
+            }
+            # Log the cancellation
+            _write_log(
+                {
+                    "email": email.lower(),
+                    "show": deleted["show"],
+                    "quantity": deleted["quantity"],
+                    "action": "cancelled",
+                    "timestamp": current_time,
+                }
+            )
+            return deleted
+
+        return None
     except PyMongoError as e:
         st.error(f"Failed to delete entry: {str(e)}")
-        return False
+        return None
 
 
 def get_all_entries() -> list: